@@ -4,17 +4,46 @@
 # - Form layout: Ticker → Shares → Price → Total Invested (auto-calc) → Dividends
 # - Version bumped to 1.9.3 to reflect fixes
 
-import json, os, re, shutil, sys
+import copy, hashlib, json, math, os, tempfile, time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
-from typing import Dict, Any
-import streamlit as st, yfinance as yf, pandas as pd, numpy as np
-import bcrypt
+from typing import Dict
+import streamlit as st, pandas as pd, numpy as np
+import orjson
 
 APP_NAME = "MKK Investment Tracker"
+APP_VERSION = "1.9.3"
+CURRENCIES = ("USD", "EUR", "GBP", "JPY", "CAD")
+_CURR_IDX = {c: i for i, c in enumerate(CURRENCIES)}
+# Median days between dividends (inclusive upper bounds) -> payout cadence
+_FREQ_MAX_DAYS = (9, 45, 115, 220, 400)
+_FREQ_LABELS = ("Weekly", "Monthly", "Quarterly", "Semiannual", "Annual", "Irregular/None")
 st.set_page_config(page_title=APP_NAME, page_icon="💠", layout="wide")
 
+# Characters stripped from money text inputs before float(); shares inputs drop commas and all Unicode whitespace
+_MONEY_TBL = str.maketrans("", "", "$, \u00a0")
+
+# Table formatting shared by the dataframe views
+# Format strings rather than callables; NaN cells render blank via na_rep=""
+_MONEY_FMT, _PCT_FMT = "${:,.2f}", "{:,.2f}%"
+_MONEY = _MONEY_FMT.format
+def money_str(x: float) -> str:
+    if x is None or not math.isfinite(x): return ""
+    return _MONEY(x)
+def fmt_money_nonzero(v): return _MONEY(v) if v else ""
+_RETURN_STYLES = np.array(["color:#dc2626;", "", "color:#16a34a;"])
+def color_returns(col):
+    x = pd.to_numeric(col, errors="coerce").to_numpy(dtype=float)
+    return _RETURN_STYLES.take(np.nan_to_num(np.sign(x)).astype(np.intp) + 1)
+
+_PORT_MONEY_COLS = ("Purchase Price", "Total Invested", "Price Now", "Current Value", "Dividends Collected", "Total Value $", "True ADA", "Overall Return $")
+_PORT_FMT = {**{c: _MONEY_FMT for c in _PORT_MONEY_COLS}, "Overall Return %": _PCT_FMT}
+_DIV_FMT = {"Dividends Collected": _MONEY_FMT, "Last Dividend $": fmt_money_nonzero}
+_ADA_FMT = {**{c: _MONEY_FMT for c in ("Total Invested", "Dividends Collected", "True ADA", "Current Price")}, "Return vs True ADA %": _PCT_FMT}
+
 # Custom CSS for polished look and feel
-st.markdown("""
+CSS_BLOCK = """
     <style>
     body {
         font-family: 'Roboto', sans-serif;
@@ -59,67 +88,181 @@ st.markdown("""
         background-color: #f0f8ff;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
+# Re-emitted every run: Streamlit drops elements a rerun does not redraw
+st.markdown(CSS_BLOCK, unsafe_allow_html=True)
 
 # User authentication and portfolio storage
 USERS_FILE = "users.json"
+# Work factor for new password hashes (existing hashes keep the cost they were made with). Each step doubles
+# hashing time; values below 12 make stolen hashes markedly cheaper to crack, so only lower it on slow hosts.
+try: BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_COST", "12"))
+except ValueError: BCRYPT_ROUNDS = 12  # a malformed value must not take down the login page
+BCRYPT_ROUNDS = min(max(BCRYPT_ROUNDS, 4), 31)
+_DEFAULT_DATA = {
+    "holdings": {},
+    "cash_uninvested": 0.0,
+    "settings": {"currency": "USD", "auto_price": True},
+    "last_prices": {},
+    "last_updated": None,
+    "version": APP_VERSION
+}
+_HOLDING_DEFAULTS = {"purchase_price": None, "dividends_collected": 0.0, "last_div_amount": 0.0, "last_div_date": "", "summary": ""}
+_HOLDING_NUMS = ("shares", "total_invested", "dividends_collected", "last_div_amount")
+
+def finite_or(v, default=0.0):
+    try: v = float(v)
+    except (TypeError, ValueError): return default
+    return v if math.isfinite(v) else default
+
+def holding_record(rec: dict) -> dict:
+    # Older files may hold NaN, which is written back as null; numeric fields must come back as floats
+    rec = _HOLDING_DEFAULTS | rec
+    for k in _HOLDING_NUMS: rec[k] = finite_or(rec.get(k))
+    rec["purchase_price"] = finite_or(rec["purchase_price"], None)
+    return rec
+
+# Users, portfolio files and backups share one encoding; only the downloaded backup is pretty-printed
+_JSON_OPTS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def json_loads(raw: bytes):
+    try: return orjson.loads(raw)
+    except orjson.JSONDecodeError: return json.loads(raw)  # files from older versions may hold NaN, which orjson rejects
+
+@st.cache_resource
 def load_users():
+    # Parsed once per process; save_users() drops the cached dict after writing
     if os.path.exists(USERS_FILE):
         try:
-            with open(USERS_FILE, "r") as f:
-                return json.load(f)
+            with open(USERS_FILE, "rb") as f:
+                return json_loads(f.read())
         except Exception:
             return {}
     return {}
 
 def save_users(users):
     try:
-        with open(USERS_FILE, "w") as f:
-            json.dump(users, f, indent=2)
+        _write_bytes(USERS_FILE, orjson.dumps(users, option=_JSON_OPTS))
     except Exception as e:
         st.warning(f"Failed to save users to {USERS_FILE}: {e}")
+    load_users.clear()
+
+# Slow-changing Yahoo lookups survive process restarts as small JSON files; TTL is checked against mtime
+CACHE_DIR = ".cache"
+
+def _disk_cache_path(ticker: str, endpoint: str) -> str:
+    return os.path.join(CACHE_DIR, hashlib.blake2b(f"{ticker}:{endpoint}".encode("utf-8"), digest_size=16).hexdigest() + ".json")
+
+def disk_cache_get(ticker: str, endpoint: str, ttl: float):
+    path = _disk_cache_path(ticker, endpoint)
+    try:
+        if time.time() - os.path.getmtime(path) > ttl: return None
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except Exception:
+        return None
+
+def disk_cache_put(ticker: str, endpoint: str, value):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(_disk_cache_path(ticker, endpoint), "wb") as f:
+            f.write(orjson.dumps(value))
+    except Exception:
+        pass
+
+def portfolio_file(user_id: str) -> str:
+    return f"portfolio_{user_id}.json"
+
+@st.cache_resource
+def _save_executor() -> ThreadPoolExecutor:
+    # Single worker, so writes land on disk in the order they were queued
+    return ThreadPoolExecutor(max_workers=1)
+
+def _write_bytes(path: str, payload: bytes):
+    # Write beside the target and swap it in, so a crash mid-write never leaves a truncated file. The temp name is
+    # unique because save_users() runs on each session's own thread, and concurrent writers must not share it.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+    except BaseException:
+        try: os.unlink(tmp)
+        except OSError: pass
+        raise
+
+@st.cache_resource
+def _pending_writes() -> Dict[str, bytes]:
+    # Newest unwritten payload per file; saves queued behind a slow write collapse into one
+    return {}
 
-def save_portfolio():
+def _flush_pending(pending: Dict[str, bytes], path: str):
+    payload = pending.pop(path, None)
+    if payload is None: return  # an earlier queued flush already wrote the newest payload
+    try:
+        _write_bytes(path, payload)
+    except Exception:
+        pending.setdefault(path, payload)  # left for the next queued flush to retry
+        raise
+
+def save_portfolio(wait: bool = False):
     if "user_id" in st.session_state and st.session_state["user_id"]:
         try:
-            data_file = f"portfolio_{st.session_state['user_id']}.json"
-            with open(data_file, "w") as f:
-                json.dump(st.session_state["DATA"], f, indent=2)
+            data_file = portfolio_file(st.session_state["user_id"])
+            prev = st.session_state.get("_save_future")
+            if prev is not None and prev.done() and prev.exception() is not None:
+                del st.session_state["_save_future"]
+                st.session_state.pop("_saved_digest", None)
+                st.warning(f"Previous save to {data_file} failed: {prev.exception()}")
+            payload = orjson.dumps(st.session_state["DATA"], option=_JSON_OPTS)
+            # Skip the write when nothing changed since the last save of this file
+            digest = (data_file, hashlib.blake2b(payload, digest_size=16).digest())
+            if st.session_state.get("_saved_digest") == digest: return
+            # The payload is already a snapshot; the disk write runs off the script thread
+            pending = _pending_writes()
+            pending[data_file] = payload
+            fut = _save_executor().submit(_flush_pending, pending, data_file)
+            st.session_state["_saved_digest"], st.session_state["_save_future"] = digest, fut
+            if wait: fut.result()
         except Exception as e:
+            st.session_state.pop("_saved_digest", None)
             st.warning(f"Failed to save portfolio to {data_file}: {e}")
 
 def load_portfolio():
     if "user_id" in st.session_state and st.session_state["user_id"]:
-        data_file = f"portfolio_{st.session_state['user_id']}.json"
+        data_file = portfolio_file(st.session_state["user_id"])
+        _save_executor().submit(lambda: None).result()  # let queued writes land before reading back
         if os.path.exists(data_file):
             try:
-                with open(data_file, "r") as f:
-                    data = json.load(f)
-                    data.setdefault("holdings", {})
-                    data.setdefault("cash_uninvested", 0.0)
-                    data.setdefault("settings", {"currency": "USD", "auto_price": True})
-                    data.setdefault("last_prices", {})
-                    data.setdefault("last_updated", None)
-                    data["version"] = "1.9.3"
-                    for rec in data.get("holdings", {}).values():
-                        rec.setdefault("purchase_price", None)
-                        rec.setdefault("dividends_collected", 0.0)
-                        rec.setdefault("last_div_amount", 0.0)
-                        rec.setdefault("last_div_date", "")
-                        rec.setdefault("summary", "")
+                with open(data_file, "rb") as f:
+                    data = json_loads(f.read())
+                    for k, v in _DEFAULT_DATA.items():
+                        if k not in data: data[k] = copy.deepcopy(v)
+                    data["version"] = APP_VERSION
+                    data["holdings"] = {t: holding_record(rec) for t, rec in data["holdings"].items()}
+                    data["cash_uninvested"] = finite_or(data["cash_uninvested"])
                     return data
             except Exception as e:
                 st.warning(f"Failed to load portfolio from {data_file}: {e}")
-    return {
-        "holdings": {},
-        "cash_uninvested": 0.0,
-        "settings": {"currency": "USD", "auto_price": True},
-        "last_prices": {},
-        "last_updated": None,
-        "version": "1.9.3"
-    }
+    return copy.deepcopy(_DEFAULT_DATA)
 
-# Login form
+@st.cache_data(show_spinner=False, max_entries=1)
+def app_source(mtime: float) -> bytes:
+    # Keyed on the file's mtime so an edited, hot-reloaded script is served fresh
+    with open(__file__, "rb") as f:
+        return f.read()
+
+def stored_cost(users) -> int:
+    # Most common work factor among stored hashes ("$2b$12$..."); baseline accounts were made at 12
+    costs = [h[4:6] for h in users.values() if isinstance(h, str) and len(h) == 60 and h[4:6].isdigit()]
+    return int(max(set(costs), key=costs.count)) if costs else 12
+
+@st.cache_resource
+def _dummy_hash(rounds: int) -> bytes:
+    import bcrypt
+    return bcrypt.hashpw(b"not-a-password", bcrypt.gensalt(rounds=rounds))
+
+# Login form (bcrypt and yfinance are imported where first needed, keeping them off the cold-start path)
 if "user_id" not in st.session_state or not st.session_state["user_id"]:
     st.title("Login to MKK Investment Tracker")
     st.markdown("Enter your username and password to access your portfolio, or register a new account.")
@@ -134,63 +277,68 @@ if "user_id" not in st.session_state or not st.session_state["user_id"]:
         register_button = col4.form_submit_button("Register")
     
     if login_button:
+        import bcrypt
         if not username or not password:
             st.error("Please enter both username and password.")
-        elif username in users:
-            hashed_password = users[username].encode('utf-8')
-            if bcrypt.checkpw(password.encode('utf-8'), hashed_password):
+        else:
+            # Unknown or malformed entries (a bcrypt hash is always 60 chars) are checked against a dummy hash,
+            # so they cost about as long as a wrong password and get the same message. Register still reveals taken names.
+            stored = users.get(username)
+            known = isinstance(stored, str) and len(stored) == 60
+            if bcrypt.checkpw(password.encode('utf-8'), stored.encode('utf-8') if known else _dummy_hash(stored_cost(users))) and known:
                 st.session_state["user_id"] = username
+                st.session_state["_auth_ok_at"] = time.time()
                 st.session_state["DATA"] = load_portfolio()
                 st.success(f"Logged in as {username}!")
                 st.rerun()
             else:
-                st.error("Incorrect password.")
-        else:
-            st.error("Username not found. Please register.")
+                st.error("Invalid username or password.")
     
     if register_button:
+        import bcrypt
         if not username or not password:
             st.error("Please enter both username and password.")
         elif username in users:
             st.error("Username already exists. Choose another or login.")
         else:
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
             users[username] = hashed_password.decode('utf-8')
             save_users(users)
             st.session_state["user_id"] = username
+            st.session_state["_auth_ok_at"] = time.time()
             st.session_state["DATA"] = load_portfolio()
             st.success(f"Registered and logged in as {username}!")
             st.rerun()
 else:
+    import yfinance as yf
     st.markdown(f"Logged in as: **{st.session_state['user_id']}**")
     st.warning("Portfolio data is saved automatically to 'portfolio_<username>.json' in the app directory. Use the 'Backup' tab for manual JSON downloads or to restore from a different file.", icon="ℹ️")
 
     if "DATA" not in st.session_state:
         st.session_state["DATA"] = load_portfolio()
+    DATA = st.session_state["DATA"]
+    HOLDINGS, LAST_PRICES, SETTINGS = DATA["holdings"], DATA["last_prices"], DATA["settings"]
 
     def money_to_float(text: str) -> float:
         if text is None: return 0.0
-        s = str(text).strip().replace(',', '').replace('$', '')
-        try: return float(s) if s else 0.0
+        s = str(text).translate(_MONEY_TBL)
+        try: v = float(s) if s else 0.0
         except: return 0.0
-
-    def money_str(x: float) -> str:
-        if x is None or not np.isfinite(x): return ""
-        return f"${x:,.2f}"
+        return v if math.isfinite(v) else 0.0
 
     def shares_to_float(text: str) -> float:
         if text is None: return 0.0
-        s = str(text).strip().replace(',', ' ').replace('\u00a0', ' ').strip()
-        s = re.sub(r'\s+', '', s)
-        try: return float(s) if s else 0.0
+        s = "".join(str(text).replace(",", "").split())
+        try: v = float(s) if s else 0.0
         except: return 0.0
+        return v if math.isfinite(v) else 0.0
 
-    @st.cache_data(show_spinner=False)
+    @st.cache_data(ttl=300, max_entries=1024, show_spinner=False)
     def fetch_price(ticker: str) -> float:
         try:
             t = yf.Ticker(ticker)
             price = t.fast_info.get('lastPrice', float('nan'))
-            if np.isnan(price):
+            if math.isnan(price):
                 hist = t.history(period="5d", interval="1d")
                 if hist is None or hist.empty: return float("nan")
                 price = float(hist["Close"].dropna().iloc[-1])
@@ -198,38 +346,173 @@ else:
         except Exception:
             return float("nan")
 
-    @st.cache_data(show_spinner=False)
-    def fetch_name_and_summary(ticker: str):
+    @st.cache_data(ttl=300, show_spinner=False)
+    def fetch_prices_bulk(tickers: tuple) -> Dict[str, float]:
+        prices = {t: float("nan") for t in tickers}
+        if not tickers: return prices
+        try:
+            df = yf.download(list(tickers), period="5d", interval="1d", threads=True, progress=False, group_by="ticker", auto_adjust=False)
+            for t in tickers:
+                try: prices[t] = float(df[t]["Close"].dropna().iloc[-1])
+                except Exception: pass
+        except Exception:
+            pass
+        # Symbols the batch download missed fall back to per-ticker lookups, overlapped on a pool
+        missing = [t for t in tickers if math.isnan(prices[t])]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(8, len(missing))) as ex:
+                prices.update(zip(missing, ex.map(fetch_price, missing)))
+        return prices
+
+    @st.cache_data(ttl=300, show_spinner=False)
+    def fetch_ticker_info(ticker: str):
+        # One Ticker.info request yields name, summary and a quote; a real name/summary also seeds the disk cache
         try:
-            tk = yf.Ticker(ticker)
-            info = tk.info or {}
-            name = info.get("longName") or info.get("shortName") or info.get("symbol") or ticker
+            info = yf.Ticker(ticker).info or {}
+            long_name = info.get("longName") or info.get("shortName")
+            name = long_name or info.get("symbol") or ticker
             summary = info.get("longBusinessSummary") or info.get("description") or ""
             if summary: summary = (summary[:500] + "…") if len(summary) > 500 else summary
-            return name, summary
-        except Exception: return ticker, ""
+            if long_name or summary: disk_cache_put(ticker, "summary", [name, summary])  # empty/throttled replies are not kept
+            price = info.get("regularMarketPrice") or info.get("currentPrice")
+            return name, summary, float(price) if price else float("nan")
+        except Exception: return ticker, "", float("nan")
 
-    @st.cache_data(show_spinner=False)
+    @st.cache_data(ttl=86400, show_spinner=False)
+    def fetch_name_and_summary(ticker: str):
+        cached = disk_cache_get(ticker, "summary", 7 * 86400)
+        if cached: return tuple(cached)
+        return fetch_ticker_info(ticker)[:2]
+
+    def dividend_frequency(div) -> str:
+        if div is None or len(div) < 3: return "Irregular/None"
+        dates = np.sort(div.index.values.astype("datetime64[D]"))
+        dates = dates[dates >= np.datetime64("today", "D") - np.timedelta64(3*365, "D")]
+        if dates.size < 3: return "Irregular/None"
+        med = float(np.median(np.diff(dates).astype(np.int64)))
+        return _FREQ_LABELS[bisect_left(_FREQ_MAX_DAYS, med)]
+
+    @st.cache_data(ttl=900, show_spinner=False)
     def fetch_dividend_frequency(ticker: str) -> str:
+        cached = disk_cache_get(ticker, "div_freq", 86400)
+        if cached: return cached
         try:
-            t = yf.Ticker(ticker)
-            div = t.dividends
-            if div is None or len(div) < 3: return "Irregular/None"
-            dates = pd.to_datetime(div.index).sort_values()
-            cutoff = pd.Timestamp.utcnow() - pd.Timedelta(days=3*365)
-            dates = dates[dates >= cutoff]
-            if len(dates) < 3: return "Irregular/None"
-            diffs = (dates[1:] - dates[:-1]).days.values
-            if len(diffs) == 0: return "Irregular/None"
-            med = float(np.median(diffs))
-            if med <= 9: return "Weekly"
-            if med <= 45: return "Monthly"
-            if med <= 115: return "Quarterly"
-            if med <= 220: return "Semiannual"
-            if med <= 400: return "Annual"
-            return "Irregular/None"
+            div = yf.Ticker(ticker).dividends
+            freq = dividend_frequency(div)
         except Exception:
             return "Irregular/None"
+        # An empty series may be a failed or throttled fetch, so it is not persisted
+        if div is not None and len(div): disk_cache_put(ticker, "div_freq", freq)
+        return freq
+
+    def sorted_tickers() -> tuple:
+        # Invalidated (popped) wherever holdings are added or removed
+        if "_sorted_tickers" not in st.session_state:
+            st.session_state["_sorted_tickers"] = tuple(sorted(HOLDINGS))
+        return st.session_state["_sorted_tickers"]
+
+    def holdings_frame(tickers: tuple) -> pd.DataFrame:
+        hold = pd.DataFrame.from_dict(HOLDINGS, orient="index").reindex(
+            index=list(tickers), columns=["shares", "purchase_price", "total_invested", "dividends_collected"])
+        hold = hold.apply(pd.to_numeric, errors="coerce").astype(float)
+        hold[["shares", "total_invested", "dividends_collected"]] = hold[["shares", "total_invested", "dividends_collected"]].fillna(0.0)
+        return hold
+
+    def refresh_prices(force: bool = False) -> int:
+        if force: fetch_prices_bulk.clear()
+        fresh = {t: p for t, p in fetch_prices_bulk(sorted_tickers()).items() if math.isfinite(p)}
+        LAST_PRICES.update(fresh)
+        # Remember what was asked for, so tickers without a quote are not retried every rerun
+        st.session_state["_prices_ts"] = time.time()
+        st.session_state["_prices_for"] = frozenset(HOLDINGS)
+        return len(fresh)
+
+    # Short TTL: successful lookups persist on disk for a day; a transient failure should not pin this dict that long
+    @st.cache_data(ttl=900, show_spinner=False)
+    def fetch_dividend_frequencies(tickers: tuple) -> Dict[str, str]:
+        freqs = {}
+        for t in tickers:
+            cached = disk_cache_get(t, "div_freq", 86400)
+            if cached: freqs[t] = cached
+        # One batched download covers the cold symbols: 3y of daily bars with dividend events, instead of each
+        # Ticker.dividends pulling full history
+        cold = [t for t in tickers if t not in freqs]
+        if cold:
+            try:
+                df = yf.download(cold, period="3y", interval="1d", actions=True, threads=True, progress=False, group_by="ticker", auto_adjust=False)
+                for t in cold:
+                    try:
+                        if not df[t]["Close"].notna().any(): continue
+                        div = df[t]["Dividends"]
+                    except Exception: continue
+                    freqs[t] = dividend_frequency(div[div > 0])
+                    disk_cache_put(t, "div_freq", freqs[t])
+            except Exception:
+                pass
+        missed = [t for t in tickers if t not in freqs]
+        if missed:
+            with ThreadPoolExecutor(max_workers=min(8, len(missed))) as ex:
+                freqs.update(zip(missed, ex.map(fetch_dividend_frequency, missed)))
+        return freqs
+
+    def top_rows(df: pd.DataFrame, weight, key: str, limit: int = 50) -> pd.DataFrame:
+        # Past `limit` rows, only the N heaviest (kept in ticker order) are sent to the browser
+        if len(df) <= limit: return df
+        n = st.slider("Rows shown (largest first)", 10, len(df), limit, key=key)
+        keep = np.sort(np.argsort(-np.asarray(weight, dtype=float), kind="stable")[:n])
+        return df.iloc[keep]
+
+    def holdings_state_key(tickers: tuple) -> bytes:
+        # Serializes everything the cached table builders read, so reruns with unchanged data are a cache hit
+        return orjson.dumps([{t: HOLDINGS[t] for t in tickers}, {t: LAST_PRICES.get(t) for t in tickers}], option=orjson.OPT_SERIALIZE_NUMPY)
+
+    @st.cache_data(max_entries=16, show_spinner=False)
+    def portfolio_frame(state_key: bytes, tickers: tuple, freqs: Dict[str, str]):
+        hold = holdings_frame(tickers)
+        shares, invested, divs = hold["shares"], hold["total_invested"], hold["dividends_collected"]
+        price = pd.Series(hold.index.map(LAST_PRICES), index=hold.index, dtype=float)
+        priced = np.isfinite(price.to_numpy())
+        market_value = shares * price
+        overall_return = (market_value - invested).fillna(0.0) + divs
+        df = pd.DataFrame({
+            "Ticker": hold.index,
+            "Payout Freq": hold.index.map(freqs),
+            "Shares": shares.round(6),
+            "Purchase Price": hold["purchase_price"],
+            "Total Invested": invested,
+            "Price Now": price,
+            "Current Value": market_value,
+            "Dividends Collected": divs,
+            "Total Value $": market_value + divs,
+            "True ADA": (invested - divs) / shares.where(shares > 0),
+            "Overall Return $": overall_return,
+            "Overall Return %": overall_return / invested.where(invested > 0) * 100.0,
+        }).reset_index(drop=True)
+        return df, (float(market_value.to_numpy()[priced].sum()), float(invested.sum()), float(divs.sum()))
+
+    @st.cache_data(max_entries=16, show_spinner=False)
+    def true_ada_frame(state_key: bytes, tickers: tuple):
+        hold = holdings_frame(tickers)
+        shares, invested, divs = hold["shares"], hold["total_invested"], hold["dividends_collected"]
+        price = pd.Series(hold.index.map(LAST_PRICES), index=hold.index, dtype=float)
+        true_ada = (invested - divs) / shares.where(shares > 0)
+        market_value = shares * price
+        df = pd.DataFrame({
+            "Ticker": hold.index,
+            "Shares": shares.round(6),
+            "Total Invested": invested,
+            "Dividends Collected": divs,
+            "True ADA": true_ada,
+            "Current Price": price,
+            "Return vs True ADA %": (price - true_ada) / true_ada.where(true_ada != 0) * 100.0,
+        }).reset_index(drop=True)
+        sums = tuple(float(v) for v in hold[["shares", "total_invested", "dividends_collected"]].to_numpy().sum(axis=0))
+        return df, market_value.to_numpy(), sums + (float(market_value.sum()),)
+
+    # Tables render from last_prices; only go to the network when they are stale or incomplete
+    if HOLDINGS and SETTINGS.get("auto_price", True) and (time.time() - st.session_state.get("_prices_ts", 0.0) > 300 or HOLDINGS.keys() - st.session_state.get("_prices_for", frozenset())):
+        refresh_prices()
+        save_portfolio()
 
     st.title("MKK Investment Tracker")
     tab_port, tab_add, tab_edit, tab_div, tab_trueada, tab_migrate, tab_backup, tab_settings = st.tabs([
@@ -238,23 +521,22 @@ else:
 
     with tab_settings:
         st.subheader("Settings", divider="gray")
-        st.session_state["DATA"]["settings"]["currency"] = st.selectbox(
+        currency = st.selectbox(
             "Currency (display only)",
-            ["USD", "EUR", "GBP", "JPY", "CAD"],
-            index=["USD", "EUR", "GBP", "JPY", "CAD"].index(st.session_state["DATA"]["settings"].get("currency", "USD"))
+            CURRENCIES,
+            index=_CURR_IDX.get(SETTINGS.get("currency", "USD"), 0)
         )
-        st.session_state["DATA"]["settings"]["auto_price"] = st.checkbox(
+        auto_price = st.checkbox(
             "Auto-update prices from the internet",
-            value=st.session_state["DATA"]["settings"].get("auto_price", True)
+            value=SETTINGS.get("auto_price", True)
         )
+        if (currency, auto_price) != (SETTINGS.get("currency", "USD"), SETTINGS.get("auto_price", True)):
+            SETTINGS["currency"] = currency
+            SETTINGS["auto_price"] = auto_price
+            save_portfolio()
         if st.button("🔄 Update all prices now"):
-            updated = 0
-            for tkr, rec in st.session_state["DATA"]["holdings"].items():
-                p = fetch_price(tkr)
-                if np.isfinite(p):
-                    st.session_state["DATA"]["last_prices"][tkr] = p
-                    updated += 1
-            st.session_state["DATA"]["last_updated"] = datetime.now().isoformat(timespec="seconds")
+            updated = refresh_prices(force=True)
+            DATA["last_updated"] = datetime.now().isoformat(timespec="seconds")
             save_portfolio()
             st.success(f"Updated {updated} tickers.")
         st.markdown("---")
@@ -262,114 +544,50 @@ else:
         st.write(f"Current user: **{st.session_state['user_id']}**")
         if st.button("Switch User"):
             st.session_state.pop("user_id", None)
-            st.session_state.pop("DATA", None)
+            for k in ("DATA", "_sorted_tickers", "_saved_digest", "_save_future", "_prices_ts", "_prices_for", "_backup_json"): st.session_state.pop(k, None)
             st.rerun()
 
     with tab_port:
-        if not st.session_state["DATA"]["holdings"]:
+        if not HOLDINGS:
             st.info("No holdings yet. Add your first position in **Add Holding**.")
         else:
             if st.button("🔄 Refresh Prices"):
-                updated = 0
-                for tkr, rec in st.session_state["DATA"]["holdings"].items():
-                    p = fetch_price(tkr)
-                    if np.isfinite(p):
-                        st.session_state["DATA"]["last_prices"][tkr] = p
-                        updated += 1
-                st.session_state["DATA"]["last_updated"] = datetime.now().isoformat(timespec="seconds")
+                updated = refresh_prices(force=True)
+                DATA["last_updated"] = datetime.now().isoformat(timespec="seconds")
                 save_portfolio()
                 st.success(f"Refreshed {updated} tickers.")
             
-            rows = []
-            total_invested = 0.0
-            total_value = 0.0
-            total_div = 0.0
-            for tkr, rec in sorted(st.session_state["DATA"]["holdings"].items()):
-                shares = float(rec.get("shares", 0))
-                invested = float(rec.get("total_invested", 0))
-                price = fetch_price(tkr) if st.session_state["DATA"]["settings"].get("auto_price", True) else float('nan')
-                if np.isnan(price): price = float(st.session_state["DATA"]["last_prices"].get(tkr, np.nan))
-                market_value = shares * price if np.isfinite(price) else np.nan
-                divs = float(rec.get("dividends_collected", 0.0))
-                total_val = (market_value + divs) if np.isfinite(market_value) else np.nan
-                overall_return = (market_value - invested if np.isfinite(market_value) else 0.0) + divs
-                ret_pct = (overall_return / invested * 100.0) if invested > 0 else np.nan
-                payout = fetch_dividend_frequency(tkr)
-                true_ada = ((invested - divs) / shares) if shares > 0 else np.nan
-
-                rows.append({
-                    "Ticker": tkr,
-                    "Payout Freq": payout,
-                    "Shares": round(shares, 6),
-                    "Purchase Price": rec.get("purchase_price", np.nan),
-                    "Total Invested": invested,
-                    "Price Now": price if np.isfinite(price) else np.nan,
-                    "Current Value": market_value if np.isfinite(market_value) else np.nan,
-                    "Dividends Collected": divs,
-                    "Total Value $": total_val,
-                    "True ADA": true_ada,
-                    "Overall Return $": overall_return if np.isfinite(overall_return) else np.nan,
-                    "Overall Return %": ret_pct if np.isfinite(ret_pct) else np.nan
-                })
-
-                if np.isfinite(market_value): total_value += market_value
-                total_invested += invested
-                total_div += divs
-
-            order = ["Ticker", "Payout Freq", "Shares", "Purchase Price", "Total Invested", "Price Now", "Current Value", "Dividends Collected", "Total Value $", "True ADA", "Overall Return $", "Overall Return %"]
-            df = pd.DataFrame(rows)[order]
-
-            money_cols = ["Purchase Price", "Total Invested", "Price Now", "Current Value", "Dividends Collected", "Total Value $", "True ADA", "Overall Return $"]
-            pct_cols = ["Overall Return %"]
-
-            def fmt_money(v): return "" if pd.isna(v) else f"${float(v):,.2f}"
-            def fmt_pct(v): return "" if pd.isna(v) else f"{float(v):,.2f}%"
-            def color_returns(v):
-                try: x = float(v)
-                except Exception: return ""
-                if not np.isfinite(x): return ""
-                if x > 0: return "color:#16a34a;"
-                if x < 0: return "color:#dc2626;"
-                return ""
-            stripe_css = [{'selector': 'tbody tr:nth-child(odd)', 'props': 'background-color: rgba(0,0,0,0.03);'}]
-
-            styler = (df.style
-                      .format({**{c: fmt_money for c in money_cols}, **{c: fmt_pct for c in pct_cols}})
-                      .map(color_returns, subset=["Overall Return $", "Overall Return %"])
-                      .set_properties(subset=money_cols + pct_cols, **{"text-align": "right"})
-                      .set_table_styles(stripe_css)
-                      )
+            tickers = sorted_tickers()
+            freqs = fetch_dividend_frequencies(tickers)
 
-            try:
-                st.dataframe(styler, use_container_width=True, height=620, hide_index=True)
-            except TypeError:
-                try:
-                    st.dataframe(styler.hide(axis="index"), use_container_width=True, height=620)
-                except Exception:
-                    df_display = df.copy()
-                    st.dataframe(df_display, use_container_width=True, height=620)
+            df, (total_value, total_invested, total_div) = portfolio_frame(holdings_state_key(tickers), tickers, freqs)
+
+            # Numeric columns are right-aligned by the grid itself; the Styler only supplies text and return colours
+            styler = df.style.format(_PORT_FMT, na_rep="").apply(color_returns, subset=["Overall Return $", "Overall Return %"])
+            st.dataframe(styler, use_container_width=True, height=620, hide_index=True)
 
             st.markdown("<div style='margin-top: 20px;'></div>", unsafe_allow_html=True)
-            overall_return = total_value + st.session_state["DATA"]["cash_uninvested"] + total_div - total_invested
+            overall_return = total_value + DATA["cash_uninvested"] + total_div - total_invested
             overall_return_pct = (overall_return / total_invested * 100.0) if total_invested > 0 else np.nan
             return_color = "#16a34a" if overall_return > 0 else "#dc2626" if overall_return < 0 else "inherit"
             cols = st.columns(5)
             cols[0].metric("Total Invested", f"${total_invested:,.2f}")
-            cols[1].metric("Current Value", f"${total_value:,.2f}" if np.isfinite(total_value) else "—")
+            cols[1].metric("Current Value", f"${total_value:,.2f}" if math.isfinite(total_value) else "—")
             with cols[2]:
-                st.metric("Cash Available", f"${st.session_state['DATA']['cash_uninvested']:,.2f}")
-                new_cash_text = st.text_input("Update Cash Available", value=money_str(st.session_state["DATA"]["cash_uninvested"]), key="port_cash", placeholder="$0.00")
-                new_cash = money_to_float(new_cash_text)
-                if new_cash != st.session_state["DATA"]["cash_uninvested"]:
-                    st.session_state["DATA"]["cash_uninvested"] = new_cash
-                    st.session_state["DATA"]["last_updated"] = datetime.now().isoformat(timespec="seconds")
+                st.metric("Cash Available", f"${DATA['cash_uninvested']:,.2f}")
+                cash_text = money_str(DATA["cash_uninvested"])
+                new_cash_text = st.text_input("Update Cash Available", value=cash_text, key="port_cash", placeholder="$0.00")
+                new_cash = money_to_float(new_cash_text) if new_cash_text != cash_text else DATA["cash_uninvested"]
+                if new_cash != DATA["cash_uninvested"]:
+                    DATA["cash_uninvested"] = new_cash
+                    DATA["last_updated"] = datetime.now().isoformat(timespec="seconds")
                     save_portfolio()
                     st.rerun()
-            cols[3].metric("Total Value", f"${total_value + st.session_state['DATA']['cash_uninvested'] + total_div:,.2f}" if np.isfinite(total_value) else "—")
+            cols[3].metric("Total Value", f"${total_value + DATA['cash_uninvested'] + total_div:,.2f}" if math.isfinite(total_value) else "—")
             with cols[4]:
                 st.markdown(f"<span style='color:{return_color}; font-size:1.1em;'>Overall Return</span>", unsafe_allow_html=True)
                 st.markdown(f"<span style='color:{return_color}; font-size:1.5em;'>{money_str(overall_return)}</span>", unsafe_allow_html=True)
-                st.markdown(f"<span style='color:{return_color}; font-size:1.2em;'>{overall_return_pct:.2f}%</span>" if np.isfinite(overall_return_pct) else "—", unsafe_allow_html=True)
+                st.markdown(f"<span style='color:{return_color}; font-size:1.2em;'>{overall_return_pct:.2f}%</span>" if math.isfinite(overall_return_pct) else "—", unsafe_allow_html=True)
 
     with tab_add:
         st.subheader("Add New Holding", divider="gray")
@@ -427,7 +645,7 @@ else:
             tkr = ticker.strip().upper()
             if not tkr:
                 st.error("Ticker required.")
-            elif tkr in st.session_state["DATA"]["holdings"]:
+            elif tkr in HOLDINGS:
                 st.error(f"{tkr} already exists. Use Edit tab to modify.")
             else:
                 sh = shares_to_float(shares_text)
@@ -441,11 +659,14 @@ else:
                     st.error("Shares must be positive.")
                 else:
                     calc_invested = inv if inv > 0 else calculated_total
-                    if calc_invested == 0 and st.session_state["DATA"]["settings"].get("auto_price", True):
-                        curr_price = fetch_price(tkr)
-                        if np.isfinite(curr_price):
+                    if calc_invested == 0 and SETTINGS.get("auto_price", True):
+                        # Needs a quote anyway, so take name/summary from the same info request
+                        name, summary, curr_price = fetch_ticker_info(tkr)
+                        if not math.isfinite(curr_price): curr_price = fetch_price(tkr)
+                        if math.isfinite(curr_price):
                             calc_invested = sh * curr_price
-                    name, summary = fetch_name_and_summary(tkr)
+                    else:
+                        name, summary = fetch_name_and_summary(tkr)
                     rec = {
                         "name": name,
                         "shares": float(sh),
@@ -456,10 +677,11 @@ else:
                         "last_div_date": ldd,
                         "summary": summary,
                     }
-                    st.session_state["DATA"]["holdings"][tkr] = rec
-                    if np.isfinite(pp) and pp > 0:
-                        st.session_state["DATA"]["last_prices"][tkr] = pp
-                    st.session_state["DATA"]["last_updated"] = datetime.now().isoformat(timespec="seconds")
+                    HOLDINGS[tkr] = rec
+                    st.session_state.pop("_sorted_tickers", None)
+                    if math.isfinite(pp) and pp > 0:
+                        LAST_PRICES[tkr] = pp
+                    DATA["last_updated"] = datetime.now().isoformat(timespec="seconds")
                     save_portfolio()
                     st.success(f"Added {tkr} with {sh:.6f} shares.")
                     st.session_state.add_ticker = ""
@@ -470,14 +692,16 @@ else:
                     st.session_state.add_last_date = None
                     st.rerun()
 
-    with tab_edit:
+    # Widget changes here rerun only this tab; saves end in st.rerun(), which redraws the whole app
+    @st.fragment
+    def edit_holding_tab():
         st.subheader("Edit or Delete Holding", divider="gray")
-        if not st.session_state["DATA"]["holdings"]:
+        if not HOLDINGS:
             st.info("Add a holding first.")
         else:
-            sel = st.selectbox("Select Ticker", options=sorted(list(st.session_state["DATA"]["holdings"].keys())))
+            sel = st.selectbox("Select Ticker", options=sorted_tickers())
             if sel:
-                rec = st.session_state["DATA"]["holdings"][sel]
+                rec = HOLDINGS[sel]
                 with st.form(key=f"edit_form_{sel}"):
                     col1, col2 = st.columns(2)
                     shares_text = st.text_input("Shares", value=f"{rec.get('shares', 0):.6f}", key=f"edit_shares_text_{sel}")
@@ -485,7 +709,7 @@ else:
                     total_invested_text = st.text_input("Total Invested (optional, overrides shares * price)", value=money_str(rec.get("total_invested", 0.0)), key=f"edit_invested_text_{sel}", placeholder="$0.00")
                     dividends_text = st.text_input("Dividends Collected", value=money_str(rec.get("dividends_collected", 0.0)), key=f"edit_divs_text_{sel}", placeholder="$0.00")
                     last_div_amt_text = st.text_input("Last Dividend Amount", value=money_str(rec.get("last_div_amount", 0.0)), key=f"edit_last_amt_text_{sel}", placeholder="$0.00")
-                    last_div_date = col1.date_input("Last Dividend Date", value=date.fromisoformat(rec.get("last_div_date")) if rec.get("last_div_date") else None, key=f"edit_last_date_{sel}")
+                    last_div_date = col1.date_input("Last Dividend Date", value=date.fromisoformat(ldd) if (ldd := rec.get("last_div_date")) else None, key=f"edit_last_date_{sel}")
                     submitted = st.form_submit_button("💾 Save Changes")
                 
                 if submitted:
@@ -495,11 +719,13 @@ else:
                     dividends = money_to_float(dividends_text)
                     last_div_amt = money_to_float(last_div_amt_text)
                     calc_invested = total_invested if total_invested > 0 else (shares * purchase_price if purchase_price > 0 else rec.get("total_invested", 0.0))
-                    if calc_invested == 0 and st.session_state["DATA"]["settings"].get("auto_price", True):
-                        curr_price = fetch_price(sel)
-                        if np.isfinite(curr_price):
+                    if calc_invested == 0 and SETTINGS.get("auto_price", True):
+                        # A quote already held for this ticker spares Save a network round-trip
+                        curr_price = float(LAST_PRICES.get(sel) or "nan")
+                        if not math.isfinite(curr_price): curr_price = fetch_price(sel)
+                        if math.isfinite(curr_price):
                             calc_invested = shares * curr_price
-                    _, summary = fetch_name_and_summary(sel)
+                    summary = rec.get("summary") or fetch_name_and_summary(sel)[1]
                     rec = {
                         "name": rec.get("name", sel),
                         "shares": float(shares),
@@ -510,10 +736,11 @@ else:
                         "last_div_date": last_div_date.isoformat() if last_div_date else "",
                         "summary": summary,
                     }
-                    st.session_state["DATA"]["holdings"][sel] = rec
-                    if np.isfinite(purchase_price) and purchase_price > 0:
-                        st.session_state["DATA"]["last_prices"][sel] = purchase_price
-                    st.session_state["DATA"]["last_updated"] = datetime.now().isoformat(timespec="seconds")
+                    HOLDINGS[sel] = rec
+                    # Tables read last_prices; with auto-pricing on, a live quote there must not be replaced by the purchase price
+                    if math.isfinite(purchase_price) and purchase_price > 0 and not (SETTINGS.get("auto_price", True) and sel in LAST_PRICES):
+                        LAST_PRICES[sel] = purchase_price
+                    DATA["last_updated"] = datetime.now().isoformat(timespec="seconds")
                     save_portfolio()
                     st.success(f"Updated {sel}")
                     st.rerun()
@@ -528,127 +755,71 @@ else:
                     delete_submitted = st.form_submit_button(f"🗑️ Delete {sel}")
                 if delete_submitted:
                     if (confirm.strip().upper() == sel.strip().upper()) and confirm_cb:
-                        if sel in st.session_state["DATA"]["holdings"]:
-                            st.session_state["DATA"]["holdings"].pop(sel, None)
-                            st.session_state["DATA"]["last_updated"] = datetime.now().isoformat(timespec="seconds")
+                        if sel in HOLDINGS:
+                            HOLDINGS.pop(sel, None)
+                            st.session_state.pop("_sorted_tickers", None)
+                            DATA["last_updated"] = datetime.now().isoformat(timespec="seconds")
                             save_portfolio()
                             st.success(f"Deleted {sel}.")
                             st.rerun()
                     else:
                         st.error("Confirmation failed. Please type the ticker exactly and check the box.")
 
-    with tab_div:
+    with tab_edit:
+        edit_holding_tab()
+
+    @st.fragment
+    def dividends_tab():
         st.subheader("Quick Dividend Entry (with last amount & date)", divider="gray")
-        if not st.session_state["DATA"]["holdings"]:
+        if not HOLDINGS:
             st.info("Add a holding first.")
         else:
-            tickers = sorted(list(st.session_state["DATA"]["holdings"].keys()))
+            tickers = sorted_tickers()
             col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
             sel = col1.selectbox("Ticker", options=tickers)
             dflt_date = date.today()
             dt = col2.date_input("Dividend date", value=dflt_date, key=f"div_date_{sel}")
             amt = col3.text_input("Dividend amount to add", value="$0.00", key=f"div_amt_{sel}")
-            def _money_to_float(s):
-                s = str(s).strip().replace(',', '').replace('$', '')
-                try: return float(s) if s else 0.0
-                except: return 0.0
             if col4.button("Add dividend"):
-                add_val = _money_to_float(amt)
-                st.session_state["DATA"]["holdings"][sel]["dividends_collected"] = float(st.session_state["DATA"]["holdings"][sel].get("dividends_collected", 0.0)) + add_val
-                st.session_state["DATA"]["holdings"][sel]["last_div_amount"] = add_val
+                add_val = money_to_float(amt)
+                HOLDINGS[sel]["dividends_collected"] = float(HOLDINGS[sel].get("dividends_collected", 0.0)) + add_val
+                HOLDINGS[sel]["last_div_amount"] = add_val
                 try:
-                    st.session_state["DATA"]["holdings"][sel]["last_div_date"] = dt.isoformat()
+                    HOLDINGS[sel]["last_div_date"] = dt.isoformat()
                 except Exception:
-                    st.session_state["DATA"]["holdings"][sel]["last_div_date"] = str(dt)
-                st.session_state["DATA"]["last_updated"] = datetime.now().isoformat(timespec="seconds")
+                    HOLDINGS[sel]["last_div_date"] = str(dt)
+                DATA["last_updated"] = datetime.now().isoformat(timespec="seconds")
                 save_portfolio()
                 st.success(f"Added {money_str(add_val)} dividend to {sel} for {dt}.")
                 st.rerun()
 
-            rows = []
-            total = 0.0
-            for tkr, rec in sorted(st.session_state["DATA"]["holdings"].items()):
-                d = float(rec.get("dividends_collected", 0.0))
-                last_amt = float(rec.get("last_div_amount", 0.0))
-                last_dt = rec.get("last_div_date", "")
-                rows.append({"Ticker": tkr,
-                             "Dividends Collected": d,
-                             "Last Dividend $": last_amt,
-                             "Last Dividend Date": last_dt})
-                total += d
-            df_div = pd.DataFrame(rows).reset_index(drop=True)
-            df_div["Dividends Collected"] = df_div["Dividends Collected"].apply(lambda v: f"${float(v):,.2f}")
-            df_div["Last Dividend $"] = df_div["Last Dividend $"].apply(lambda v: f"${float(v):,.2f}" if v else "")
-            try:
-                st.dataframe(df_div.style.set_table_styles([{'selector': 'tbody tr:nth-child(odd)', 'props': 'background-color: rgba(0,0,0,0.03);'}]), use_container_width=True, height=360, hide_index=True)
-            except TypeError:
-                try:
-                    st.dataframe(df_div.style.hide(axis="index").set_table_styles([{'selector': 'tbody tr:nth-child(odd)', 'props': 'background-color: rgba(0,0,0,0.03);'}]), use_container_width=True, height=360)
-                except Exception:
-                    st.dataframe(df_div, use_container_width=True, height=360)
+            recs = [HOLDINGS[t] for t in tickers]
+            divs = np.fromiter((float(r.get("dividends_collected") or 0.0) for r in recs), np.float64, len(recs))
+            df_div = pd.DataFrame({
+                "Ticker": tickers,
+                "Dividends Collected": divs,
+                "Last Dividend $": np.fromiter((float(r.get("last_div_amount") or 0.0) for r in recs), np.float64, len(recs)),
+                "Last Dividend Date": [r.get("last_div_date", "") for r in recs],
+            })
+            total = float(divs.sum())
+            df_div = top_rows(df_div, df_div["Dividends Collected"], "div_rows")
+            st.dataframe(df_div.style.format(_DIV_FMT, na_rep=""), use_container_width=True, height=360, hide_index=True)
             st.metric("Total Dividends Collected", money_str(total))
 
+    with tab_div:
+        dividends_tab()
+
     with tab_trueada:
         st.subheader("True Adjusted Dividend Average (True ADA)", divider="gray")
-        if not st.session_state["DATA"]["holdings"]:
+        if not HOLDINGS:
             st.info("Add a holding first to calculate True ADA.")
         else:
-            rows = []
-            sum_shares = 0.0
-            sum_invested = 0.0
-            sum_div = 0.0
-            total_value = 0.0
-            for tkr, rec in sorted(st.session_state["DATA"]["holdings"].items()):
-                shares = float(rec.get("shares", 0.0))
-                invested = float(rec.get("total_invested", 0.0))
-                divs = float(rec.get("dividends_collected", 0.0))
-                true_ada = (invested - divs) / shares if shares > 0 else np.nan
-                price = fetch_price(tkr) if st.session_state["DATA"]["settings"].get("auto_price", True) else float('nan')
-                if np.isnan(price): price = float(st.session_state["DATA"]["last_prices"].get(tkr, np.nan))
-                market_value = shares * price if np.isfinite(price) else np.nan
-                vs_true_pct = ((price - true_ada) / true_ada * 100.0) if (shares > 0 and np.isfinite(price) and np.isfinite(true_ada) and true_ada != 0) else np.nan
-                rows.append({
-                    "Ticker": tkr,
-                    "Shares": round(shares, 6),
-                    "Total Invested": invested,
-                    "Dividends Collected": divs,
-                    "True ADA": true_ada,
-                    "Current Price": price if np.isfinite(price) else np.nan,
-                    "Return vs True ADA %": vs_true_pct
-                })
-                sum_shares += shares
-                sum_invested += invested
-                sum_div += divs
-                if np.isfinite(market_value): total_value += market_value
-
-            df = pd.DataFrame(rows)
-            df_display = df.copy()
-            for c in ["Total Invested", "Dividends Collected", "True ADA", "Current Price"]:
-                df_display[c] = df_display[c].apply(lambda v: "" if pd.isna(v) else f"${float(v):,.2f}")
-            def fmt_pct(v): return "" if pd.isna(v) else f"{float(v):,.2f}%"
-            df_display["Return vs True ADA %"] = df_display["Return vs True ADA %"].apply(fmt_pct)
-
-            def color_pct(v):
-                try: x = float(str(v).replace('%', ''))
-                except: return ""
-                if not np.isfinite(x): return ""
-                if x > 0: return "color:#16a34a;"
-                if x < 0: return "color:#dc2626;"
-                return ""
-
-            styler = (df_display.style
-                      .map(color_pct, subset=["Return vs True ADA %"])
-                      .set_properties(subset=["Total Invested", "Dividends Collected", "True ADA", "Current Price", "Return vs True ADA %"], **{"text-align": "right"})
-                      .set_table_styles([{'selector': 'tbody tr:nth-child(odd)', 'props': 'background-color: rgba(0,0,0,0.03);'}])
-                      )
+            tickers = sorted_tickers()
+            df, market_value, (sum_shares, sum_invested, sum_div, total_value) = true_ada_frame(holdings_state_key(tickers), tickers)
+            df = top_rows(df, market_value, "ada_rows")
 
-            try:
-                st.dataframe(styler, use_container_width=True, height=520, hide_index=True)
-            except TypeError:
-                try:
-                    st.dataframe(styler.hide(axis="index"), use_container_width=True, height=520)
-                except Exception:
-                    st.dataframe(df_display, use_container_width=True, height=520)
+            styler = df.style.format(_ADA_FMT, na_rep="").apply(color_returns, subset=["Return vs True ADA %"])
+            st.dataframe(styler, use_container_width=True, height=520, hide_index=True)
 
             if sum_shares > 0:
                 avg_cost_portfolio = (sum_invested / sum_shares)
@@ -661,10 +832,10 @@ else:
 
             c1, c2, c3, c4, c5 = st.columns(5)
             c1.metric("Total Dividends Collected", f"${sum_div:,.2f}")
-            c2.metric("Total Value", money_str(total_value + st.session_state["DATA"]["cash_uninvested"]) if np.isfinite(total_value) else "—")
-            c3.metric("Unadjusted Avg Cost (Portfolio)", f"${avg_cost_portfolio:,.2f}" if np.isfinite(avg_cost_portfolio) else "—")
-            c4.metric("True ADA (Portfolio)", f"${true_ada_portfolio:,.2f}" if np.isfinite(true_ada_portfolio) else "—")
-            c5.metric("Adjusted Basis Improvement", f"{improvement_pct:.2f}%" if np.isfinite(improvement_pct) else "—")
+            c2.metric("Total Value", money_str(total_value + DATA["cash_uninvested"]) if math.isfinite(total_value) else "—")
+            c3.metric("Unadjusted Avg Cost (Portfolio)", f"${avg_cost_portfolio:,.2f}" if math.isfinite(avg_cost_portfolio) else "—")
+            c4.metric("True ADA (Portfolio)", f"${true_ada_portfolio:,.2f}" if math.isfinite(true_ada_portfolio) else "—")
+            c5.metric("Adjusted Basis Improvement", f"{improvement_pct:.2f}%" if math.isfinite(improvement_pct) else "—")
 
     with tab_migrate:
         st.subheader("Migrate from older version", divider="gray")
@@ -673,24 +844,18 @@ else:
         merge_mode = st.radio("Merge strategy", ["Add new tickers only", "Overwrite existing tickers with incoming data"])
         if upl is not None and st.button("Merge now"):
             try:
-                incoming = json.load(upl)
-                inc_holdings = incoming.get("holdings", {})
-                added = 0
-                updated = 0
-                for tkr, rec in inc_holdings.items():
-                    rec.setdefault("last_div_amount", 0.0)
-                    rec.setdefault("last_div_date", "")
-                    rec.setdefault("purchase_price", None)
-                    rec.setdefault("dividends_collected", 0.0)
-                    rec.setdefault("summary", "")
-                    if tkr not in st.session_state["DATA"]["holdings"]:
-                        st.session_state["DATA"]["holdings"][tkr] = rec
-                        added += 1
-                    else:
-                        if merge_mode.startswith("Overwrite"):
-                            st.session_state["DATA"]["holdings"][tkr] = rec
-                            updated += 1
-                st.session_state["DATA"]["last_updated"] = datetime.now().isoformat(timespec="seconds")
+                incoming = json_loads(upl.getvalue())
+                inc_holdings = {t: holding_record(rec) for t, rec in incoming.get("holdings", {}).items()}
+                new_tickers = inc_holdings.keys() - HOLDINGS.keys()
+                added = len(new_tickers)
+                if merge_mode.startswith("Overwrite"):
+                    updated = len(inc_holdings) - added
+                    HOLDINGS.update(inc_holdings)
+                else:
+                    updated = 0
+                    HOLDINGS.update({t: inc_holdings[t] for t in new_tickers})
+                st.session_state.pop("_sorted_tickers", None)
+                DATA["last_updated"] = datetime.now().isoformat(timespec="seconds")
                 save_portfolio()
                 st.success(f"Merged successfully. Added: {added}, Updated: {updated}.")
                 st.rerun()
@@ -699,36 +864,36 @@ else:
 
     with tab_backup:
         st.subheader("Backup & Restore", divider="gray")
-        new_cash_text = st.text_input("Cash Available", value=money_str(st.session_state["DATA"]["cash_uninvested"]), key="backup_cash_text", placeholder="$0.00")
-        new_cash = money_to_float(new_cash_text)
-        if new_cash != st.session_state["DATA"]["cash_uninvested"]:
-            st.session_state["DATA"]["cash_uninvested"] = new_cash
-            st.session_state["DATA"]["last_updated"] = datetime.now().isoformat(timespec="seconds")
+        cash_text = money_str(DATA["cash_uninvested"])
+        new_cash_text = st.text_input("Cash Available", value=cash_text, key="backup_cash_text", placeholder="$0.00")
+        new_cash = money_to_float(new_cash_text) if new_cash_text != cash_text else DATA["cash_uninvested"]
+        if new_cash != DATA["cash_uninvested"]:
+            DATA["cash_uninvested"] = new_cash
+            DATA["last_updated"] = datetime.now().isoformat(timespec="seconds")
             save_portfolio()
             st.rerun()
-        data_json = json.dumps(st.session_state["DATA"], indent=2)
+        # Cached per session on the digest of the last save (it names this user's file and covers every write path);
+        # with no save yet this session, serialize fresh rather than trust a stale copy
+        digest, cached = st.session_state.get("_saved_digest"), st.session_state.get("_backup_json")
+        if digest is not None and cached is not None and cached[0] == digest:
+            data_json = cached[1]
+        else:
+            data_json = orjson.dumps(DATA, option=_JSON_OPTS | orjson.OPT_INDENT_2)
+            if digest is not None: st.session_state["_backup_json"] = (digest, data_json)
         st.download_button("⬇️ Download backup (JSON)", data=data_json, file_name=f"portfolio_{st.session_state['user_id']}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json", mime="application/json")
-        st.download_button("⬇️ Download tracker_app.py", data=open(__file__, "r").read(), file_name="tracker_app.py", mime="text/python")
+        st.download_button("⬇️ Download tracker_app.py", data=app_source(os.path.getmtime(__file__)), file_name="tracker_app.py", mime="text/python")
         upl = st.file_uploader("Restore from JSON backup", type=["json"])
         if upl is not None and st.button("Restore now"):
             try:
-                incoming = json.load(upl)
-                incoming.setdefault("settings", {})
-                incoming["settings"].setdefault("currency", "USD")
-                incoming["settings"].setdefault("auto_price", True)
-                incoming.setdefault("last_prices", {})
-                incoming.setdefault("last_updated", None)
-                incoming.setdefault("cash_uninvested", 0.0)
-                incoming["version"] = "1.9.3"
-                for rec in incoming.get("holdings", {}).values():
-                    rec.setdefault("purchase_price", None)
-                    rec.setdefault("dividends_collected", 0.0)
-                    rec.setdefault("last_div_amount", 0.0)
-                    rec.setdefault("last_div_date", "")
-                    rec.setdefault("summary", "")
-                st.session_state["DATA"] = incoming
-                st.session_state["DATA"]["last_updated"] = datetime.now().isoformat(timespec="seconds")
-                save_portfolio()
+                incoming = copy.deepcopy(_DEFAULT_DATA) | json_loads(upl.getvalue())
+                incoming["settings"] = _DEFAULT_DATA["settings"] | incoming["settings"]
+                incoming["version"] = APP_VERSION
+                incoming["holdings"] = {t: holding_record(rec) for t, rec in incoming["holdings"].items()}
+                incoming["cash_uninvested"] = finite_or(incoming["cash_uninvested"])
+                st.session_state["DATA"] = DATA = incoming
+                st.session_state.pop("_sorted_tickers", None)
+                DATA["last_updated"] = datetime.now().isoformat(timespec="seconds")
+                save_portfolio(wait=True)
                 st.success("Backup restored.")
                 st.rerun()
             except Exception as e: